@@ -1,9 +1,31 @@
-import matplotlib.pyplot as plt
-from matplotlib.patches import Rectangle
-import binance.spot as bn
+import numba
+import numpy as np
+import os
 import pandas as pd
+import pyarrow as pa
+import tempfile
 import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
+from typing import TYPE_CHECKING
+
+# matplotlib, binance-connector and requests are imported where they are used,
+# so loading cached data or importing the helpers does not pay for them
+if TYPE_CHECKING:
+    import binance.spot as bn
+
+# positions of the _CANDLE_SCHEMA fields in a Binance kline, the other four fields are never used
+_KLINE_COL_INDICES = [0, 1, 2, 3, 4, 5, 6, 8]
+_CANDLE_SCHEMA = pa.schema([("open_timestamp", pa.int64()), ("open", pa.float32()), ("high", pa.float32()),
+                            ("low", pa.float32()), ("close", pa.float32()), ("volume", pa.float32()),
+                            ("close_timestamp", pa.int64()), ("trades_number", pa.int32())])
+# concurrent klines requests, kept low to stay well inside Binance's request weight limit
+_MAX_FETCH_WORKERS = 8
+_MAX_FETCH_ATTEMPTS = 6
+# upper bound in seconds for a single wait between attempts, including server requested ones
+_MAX_RETRY_DELAY = 30
+_CACHE_DIR = "cache"
 
 
 def convert_timeframe(timeframe_string: str) -> int:
@@ -34,7 +56,66 @@ def convert_timeframe(timeframe_string: str) -> int:
     return timeframe_ms
 
 
-def get_table(client: bn.Spot, symbol: str, last_time: int, timeframe_str: str, timeframe_ms: int) -> pd.DataFrame:
+def _as_soa(df: pd.DataFrame, cols: list) -> tuple:
+    """
+    Extracts the given columns of a dataframe as NumPy arrays, so hot loops index arrays
+    instead of going through pandas indexing
+
+    Args:
+        df (pd.DataFrame): dataframe to read the columns from
+        cols (list): column names, they become the field names of the returned tuple
+
+    Returns:
+        namedtuple of np.ndarray objects, one per column
+    """
+    return namedtuple("SoA", cols)(*(df[col].to_numpy() for col in cols))
+
+
+def _read_cached_parquet(path: str) -> pd.DataFrame | None:
+    """
+    Reads a parquet file from the cache folder, deleting it if it can't be read (e.g. a partial write)
+
+    Args:
+        path (str): path of the cached parquet file
+
+    Returns:
+        Pandas Dataframe object stored in the file, or None if it is missing or unreadable
+    """
+    if not os.path.exists(path):
+        return None
+    try:
+        return pd.read_parquet(path)
+    except (OSError, ValueError) as e:
+        print("removing unreadable cache file", path, repr(e))
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        return None
+
+
+def _write_cached_parquet(data: pd.DataFrame, path: str) -> None:
+    """
+    Writes a dataframe to the cache folder through a temporary file that is renamed into place,
+    so an interrupted write never leaves a partial file under the final name
+
+    Args:
+        data (pd.DataFrame): dataframe to store
+        path (str): final path of the parquet file inside the cache folder
+    """
+    os.makedirs(_CACHE_DIR, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=_CACHE_DIR, suffix=".tmp")
+    os.close(fd)
+    try:
+        data.to_parquet(tmp_path, compression="zstd")
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def get_table(client: "bn.Spot", symbol: str, last_time: int, timeframe_str: str,
+              timeframe_ms: int) -> pd.DataFrame | None:
     """
     gets price candles for given symbol in given period and timeframe (gets 1000 candles max)
 
@@ -48,26 +129,72 @@ def get_table(client: bn.Spot, symbol: str, last_time: int, timeframe_str: str,
     Returns:
         Pandas Dataframe object with columns: 
             "open_timestamp", "open", "high", "low", "close", "volume",
-            "close_timestamp", "qvolume", "trades_number",
-            "taker_buy_base_volume", "taker_buy_quote_volume", "ignore"
+            "close_timestamp", "trades_number"
+        or None if the candles couldn't be fetched (all attempts failed or the IP is banned)
     """
-    try:
-        starttime = last_time - timeframe_ms * 1000
-        table = client.klines(symbol, timeframe_str, startTime=starttime, endTime=last_time + 1, limit=1000)
+    import binance.error
+    import requests
+
+    starttime = last_time - timeframe_ms * 1000
+    table = None
+    for attempt in range(_MAX_FETCH_ATTEMPTS):
+        try:
+            table = client.klines(symbol, timeframe_str, startTime=starttime, endTime=last_time + 1, limit=1000)
+            break
+        except (requests.RequestException, binance.error.ServerError, binance.error.ClientError) as e:
+            delay = min(_MAX_RETRY_DELAY, 0.5 * 2 ** attempt)
+            print("error getting table!", repr(e))
+            if isinstance(e, binance.error.ClientError):
+                if e.status_code == 418:
+                    # IP is banned, more requests would only extend the ban
+                    break
+                # rate limits (429) are the only other client error worth retrying
+                if e.status_code != 429:
+                    raise
+                delay = min(_MAX_RETRY_DELAY, float(e.header.get("Retry-After", delay)))
+            if attempt < _MAX_FETCH_ATTEMPTS - 1:
+                time.sleep(delay)
+
+    if table is None:
+        return None
+    if len(table) > 0:
+        columns = list(zip(*table))
+        arrays = [pa.array(columns[index]).cast(field.type)
+                  for index, field in zip(_KLINE_COL_INDICES, _CANDLE_SCHEMA)]
+        data = pa.Table.from_arrays(arrays, schema=_CANDLE_SCHEMA).to_pandas(types_mapper=pd.ArrowDtype)
+        return data
+    else:
+        return _CANDLE_SCHEMA.empty_table().to_pandas(types_mapper=pd.ArrowDtype)
+
+
+def get_cached_table(client: "bn.Spot", symbol: str, last_time: int, timeframe_str: str, timeframe_ms: int,
+                     current_timestamp: int) -> pd.DataFrame | None:
+    """
+    Same as get_table, but reads chunks whose candles have all closed from a parquet cache on disk
+    and stores newly fetched closed chunks there (the still open, most recent chunk is never cached)
+
+    Args:
+        client (bn.Spot): Binance connector spot client object
+        symbol (str): A trading pair in Binance exchange (e.g. "BTCUSDT", "UNIBTC")
+        last_time (int): Unix timestamp for the last candle
+        timeframe_str (str): 1m, 30m, 1h, 4h, 1d, 1w, etc.
+        timeframe_ms (int): 1m -> 60 * 1000 = 60000, 1h -> 60 * 60 * 1000 = 3600000
+        current_timestamp (int): Unix timestamp of the moment the candles are requested
 
-        if len(table) > 0:
-            data = pd.DataFrame(table, columns=["open_timestamp", "open", "high", "low", "close", "volume",
-                                                "close_timestamp", "qvolume", "trades_number",
-                                                "taker_buy_base_volume", "taker_buy_quote_volume", "ignore"])
+    Returns:
+        Pandas Dataframe object with the same columns as get_table, or None if fetching failed
+    """
+    closed = last_time + timeframe_ms <= current_timestamp
+    path = os.path.join(_CACHE_DIR, f"{symbol}_{timeframe_str}_{last_time}.parquet")
+    if closed:
+        data = _read_cached_parquet(path)
+        if data is not None:
             return data
-        else:
-            return pd.DataFrame(columns=["open_timestamp", "open", "high", "low", "close", "volume",
-                                         "close_timestamp", "qvolume", "trades_number", "taker_buy_base_volume",
-                                         "taker_buy_quote_volume", "ignore"])
-    except:
-        print("error getting table!")
-        time.sleep(3)
-        return get_table(client, symbol, last_time, timeframe_str, timeframe_ms)
+
+    data = get_table(client, symbol, last_time, timeframe_str, timeframe_ms)
+    if closed and data is not None and len(data):
+        _write_cached_parquet(data, path)
+    return data
 
 
 def get_candles(symbol: str, start_time: int, timeframe_str: str) -> pd.DataFrame:
@@ -82,62 +209,84 @@ def get_candles(symbol: str, start_time: int, timeframe_str: str) -> pd.DataFram
     Returns:
         Pandas Dataframe object with columns: 
             "open_timestamp", "open", "high", "low", "close", "volume",
-            "close_timestamp", "qvolume", "trades_number",
-            "taker_buy_base_volume", "taker_buy_quote_volume", "ignore"
+            "close_timestamp", "trades_number"
+        its attrs["missing_chunks"] holds the number of 1000 candle chunks that couldn't be fetched,
+        if it isn't 0 the candles have holes that generate_missing_candles can't really fill
     """
+    import binance.spot as bn
+
     timeframe_ms = convert_timeframe(timeframe_str)
     client = bn.Spot()
     current_timestamp = int(datetime.now().timestamp()*1000)
     last_timestamp_in_timeframe = current_timestamp - \
         (current_timestamp % timeframe_ms)
-    candles_df = pd.DataFrame(columns=["open_timestamp", "open", "high", "low", "close", "volume",
-                                       "close_timestamp", "qvolume", "trades_number", "taker_buy_base_volume",
-                                       "taker_buy_quote_volume", "ignore"])
-    for last_time in range(last_timestamp_in_timeframe, start_time, -timeframe_ms * 1000):
-        data = get_table(client, symbol, last_time,
-                         timeframe_str, timeframe_ms)
-        candles_df = pd.concat([candles_df, data], axis=0)
+    # older chunks end on a fixed grid so their cache keys stay the same between runs,
+    # the most recent chunk ends at the current candle and overlaps the first of them
+    chunk_ms = timeframe_ms * 1000
+    aligned_last_time = last_timestamp_in_timeframe - (last_timestamp_in_timeframe % chunk_ms)
+    last_times = [last_timestamp_in_timeframe] + \
+        list(range(aligned_last_time, start_time, -chunk_ms))
+    frames = []
+    missing_chunks = 0
+    with ThreadPoolExecutor(max_workers=_MAX_FETCH_WORKERS) as executor:
+        futures = [executor.submit(get_cached_table, client, symbol, last_time, timeframe_str, timeframe_ms,
+                                   current_timestamp)
+                   for last_time in last_times]
+        for future in as_completed(futures):
+            data = future.result()
+            if data is None:
+                missing_chunks += 1
+            elif len(data):
+                frames.append(data)
+    if frames:
+        candles_df = pd.concat(frames, axis=0, ignore_index=True)
+    else:
+        candles_df = _CANDLE_SCHEMA.empty_table().to_pandas(types_mapper=pd.ArrowDtype)
+    candles_df = candles_df.drop_duplicates(subset="open_timestamp")
     candles_df = candles_df.sort_values(
         by="open_timestamp", ascending=True, ignore_index=True)
-    candles_df = candles_df.astype(float)
+    candles_df.attrs["missing_chunks"] = missing_chunks
     return candles_df
 
 
 def generate_missing_candles(data: pd.DataFrame) -> pd.DataFrame:
     """
-    Drops extra columns and finds missing candles in dataframe and generates them
+    Finds missing candles in dataframe and generates them
 
     Args:
         data: Pandas Dataframe object with columns: 
             "open_timestamp", "open", "high", "low", "close", "volume",
-            "close_timestamp", "qvolume", "trades_number",
-            "taker_buy_base_volume", "taker_buy_quote_volume", "ignore"
+            "close_timestamp", "trades_number"
 
     Returns:
         Pandas Dataframe object with columns: 
             "open_timestamp", "open", "high", "low", "close", "volume",
             "close_timestamp", "trades_number"
     """
-    data = data.drop(axis="columns",
-                    labels=["qvolume", "taker_buy_base_volume",
-                            "taker_buy_quote_volume", "ignore"])
-
-    for index in range(1, len(data)):
-        if data["close_timestamp"][index - 1] + 1 != data["open_timestamp"][index]:
-            open_timestamp = data["close_timestamp"][index - 1] + 1
-            open_price = data["close"][index - 1]
-            close_price = data["open"][index]
-            high_price = max(open_price, close_price)
-            low_price = min(open_price, close_price)
-            volume = sum([data["volume"][index - 1], data["volume"][index]]) / 2
-            close_timestamp = data["open_timestamp"][index] - 1
-            trades_number = sum([data["trades_number"][index - 1],
-                                data["trades_number"][index]]) / 2
-            new_row = pd.DataFrame([[open_timestamp, open_price, high_price, low_price,
-                                    close_price, volume, close_timestamp, trades_number]],
-                                    columns=["open_timestamp", "open", "high", "low", "close",
-                                            "volume", "close_timestamp", "trades_number",])
-            data = pd.concat([data, new_row], axis=0)
+    arr = _as_soa(data, ["open_timestamp", "close_timestamp", "open", "close",
+                         "volume", "trades_number"])
+
+    prev_close = arr.close_timestamp[:-1]
+    next_open = arr.open_timestamp[1:]
+    gap = np.flatnonzero((prev_close + 1) != next_open)
+    if len(gap) == 0:
+        return data
+
+    new_open_price = arr.close[gap]
+    new_close_price = arr.open[gap + 1]
+    gaps = pd.DataFrame({"open_timestamp": prev_close[gap] + 1,
+                         "open": new_open_price,
+                         "high": np.maximum(new_open_price, new_close_price),
+                         "low": np.minimum(new_open_price, new_close_price),
+                         "close": new_close_price,
+                         "volume": 0.5 * (arr.volume[gap] + arr.volume[gap + 1]),
+                         "close_timestamp": next_open[gap] - 1,
+                         "trades_number": np.rint(0.5 * (arr.trades_number[gap].astype(np.float64) +
+                                                         arr.trades_number[gap + 1]))},
+                        columns=data.columns)
+    # keep the column dtypes independent of whether the data had gaps
+    gaps = gaps.astype(data.dtypes.to_dict())
+    data = pd.concat([data, gaps], axis=0, ignore_index=True)
     data = data.sort_values(by="open_timestamp", ascending=True, ignore_index=True)
     return data
 
@@ -155,49 +304,127 @@ def generate_vol_per_trade(data: pd.DataFrame) -> pd.DataFrame:
             "open_timestamp", "open", "high", "low", "close", "volume",
             "close_timestamp", "trades_number", "volume_per_trade"
     """
-    data["volume_per_trade"] = data["volume"] / data["trades_number"]
+    # plain float64 so candles without trades give NaN (or inf) rather than an Arrow <NA>
+    data["volume_per_trade"] = data["volume"].astype("float64") / data["trades_number"].astype("float64")
     return data
 
 
-def find_base_candles(data: pd.DataFrame, nocffz: int) -> pd.DataFrame:
+def build_dataset(symbol: str, start_time: int, timeframe_str: str) -> pd.DataFrame:
     """
-    Calculates and adds the momentum for every candle in the dataframe,
-    then assigns a type (momentum or base) to every candle.
+    Gets candles, generates the missing ones and the volume per trade, reusing the result from
+    a parquet file in the cache folder if it was built during the current candle of the timeframe.
+    The result is only cached if every chunk of candles could be fetched.
 
     Args:
-        nocffz: number of candles after and candles before every candle 
-        that are being used for finding zones \n
-        data: Pandas Dataframe object with columns: 
-            "open_timestamp", "open", "high", "low", "close", "volume",
-            "close_timestamp", "trades_number", "volume_per_trade"
+        symbol (str): A trading pair in Binance exchange (e.g. "BTCUSDT", "UNIBTC")
+        start_time (int): Open timestamp of the first price candle it gets in Unix format
+        timeframe_str (str): 1m, 30m, 1h, 4h, 1d, 1w, etc.
 
     Returns:
         Pandas Dataframe object with columns: 
             "open_timestamp", "open", "high", "low", "close", "volume",
-            "close_timestamp", "trades_number", "volume_per_trade", 
-            "candle_type", "momentum"
+            "close_timestamp", "trades_number", "volume_per_trade"
     """
-    data["candle_type"] = "momentum"
-    data["momentum"] = [abs(row[1]["close"] - row[1]["open"])
-                        for row in data.iterrows()]
-
+    timeframe_ms = convert_timeframe(timeframe_str)
+    current_timestamp = int(datetime.now().timestamp()*1000)
+    last_timestamp_in_timeframe = current_timestamp - \
+        (current_timestamp % timeframe_ms)
+    path = os.path.join(_CACHE_DIR, f"{symbol}_{timeframe_str}_from_{start_time}.parquet")
+    if os.path.exists(path) and os.path.getmtime(path) * 1000 >= last_timestamp_in_timeframe:
+        data = _read_cached_parquet(path)
+        if data is not None:
+            return data
 
-    for index in range(nocffz, len(data) - nocffz):
-        if (sum([data["momentum"][i] for i in range(index - nocffz, index + nocffz + 1)
-                if i != index]) / (2 * nocffz)) > 6 * data["momentum"][index]:
-            data.at[index, "candle_type"] = "base"
-    
+    candles = get_candles(symbol, start_time, timeframe_str)
+    missing_chunks = candles.attrs["missing_chunks"]
+    data = generate_vol_per_trade(generate_missing_candles(candles))
+    if missing_chunks:
+        print(f"{missing_chunks} chunk(s) of candles couldn't be fetched, not caching the dataset")
+    else:
+        _write_cached_parquet(data, path)
     return data
 
 
-def find_zones(data: pd.DataFrame, max_num_touches: int) -> pd.DataFrame:
-    """Creates a new dataframe containing all valid price action zones
+@numba.njit(cache=True)
+def count_touches(highs: np.ndarray, lows: np.ndarray, start: int,
+                  base_low: float, base_high: float, max_num_touches: int) -> int:
+    """
+    Counts candles from a given index onward that touch a zone, stopping as soon as
+    the count exceeds max_num_touches
+
+    Args:
+        highs (np.ndarray): high prices of all candles
+        lows (np.ndarray): low prices of all candles
+        start (int): index of the first candle after the base candle
+        base_low (float): low price of the base candle
+        base_high (float): high price of the base candle
+        max_num_touches (int): maximum number of candles 
+        that touch a zone without making it invalid
+
+    Returns:
+        number_of_touches (int): number of touches, at most max_num_touches + 1
+    """
+    number_of_touches = 0
+    for j in range(start, len(highs)):
+        if (highs[j] > base_low and highs[j] < base_high) or \
+        (lows[j] > base_low and lows[j] < base_high):
+            number_of_touches += 1
+            if number_of_touches > max_num_touches:
+                break
+    return number_of_touches
+
+
+@numba.njit(cache=True, parallel=True)
+def detect_zones(open_: np.ndarray, close_: np.ndarray, high: np.ndarray, low: np.ndarray,
+                 open_ts: np.ndarray, close_ts: np.ndarray, nocffz: int, max_num_touches: int) -> tuple:
+    """
+    Finds base candles, whose mean momentum of the nocffz candles before and after them is more than
+    6 times their own momentum, then keeps those touched by at most max_num_touches later candles.
+    Base candles are validated in parallel since each one is independent
+
+    Args:
+        open_, close_, high, low (np.ndarray): prices of all candles
+        open_ts, close_ts (np.ndarray): open and close timestamps of all candles
+        nocffz (int): number of candles after and candles before every candle 
+        that are being used for finding zones
+        max_num_touches (int): maximum number of candles 
+        that touch a zone without making it invalid
+
+    Returns:
+        (zone_close_ts, zone_high, zone_low): arrays describing every valid zone
+    """
+    n = len(open_)
+    mom = np.abs(close_ - open_)
+    is_base = np.zeros(n, dtype=np.bool_)
+    window_sum = 0.0
+    for i in range(min(2 * nocffz + 1, n)):
+        window_sum += mom[i]
+    for i in range(nocffz, n - nocffz):
+        if i > nocffz:
+            window_sum += mom[i + nocffz] - mom[i - nocffz - 1]
+        if (window_sum - mom[i]) / (2 * nocffz) > 6 * mom[i]:
+            is_base[i] = True
+
+    base_idx = np.flatnonzero(is_base)
+    valid = np.zeros(len(base_idx), dtype=np.bool_)
+    for k in numba.prange(len(base_idx)):
+        i = base_idx[k]
+        start = np.searchsorted(open_ts, close_ts[i], side="right")
+        valid[k] = count_touches(high, low, start, low[i], high[i], max_num_touches) <= max_num_touches
+
+    zone_idx = base_idx[valid]
+    return close_ts[zone_idx], high[zone_idx], low[zone_idx]
+
+
+def find_zones_from_candles(data: pd.DataFrame, nocffz: int, max_num_touches: int) -> pd.DataFrame:
+    """Finds base candles and valid price action zones in one compiled pass (see detect_zones)
 
     Args:
         data: Pandas Dataframe object with columns: 
             "open_timestamp", "open", "high", "low", "close", "volume",
-            "close_timestamp", "trades_number", "volume_per_trade", 
-            "candle_type", "momentum"
+            "close_timestamp", "trades_number", "volume_per_trade"
+        nocffz (int): number of candles after and candles before every candle 
+        that are being used for finding zones
         max_num_touches (int): maximum number of candles 
         that touch a zone without making it invalid
 
@@ -205,28 +432,17 @@ def find_zones(data: pd.DataFrame, max_num_touches: int) -> pd.DataFrame:
         Pandas Dataframe object with columns: 
             "close_timestamp", "high", "low"
     """
-    zones = []
-    for base_candle_row in data[data["candle_type"] == "base"].iterrows():
-        base_candle = base_candle_row[1]
-        number_of_touches = 0
-        for candle_row in data[data["open_timestamp"] > base_candle["close_timestamp"]].iterrows():
-            candle = candle_row[1]
-            if (candle["high"] > base_candle["low"] and candle["high"] < base_candle["high"]) or \
-            (candle["low"] > base_candle["low"] and candle["low"] < base_candle["high"]):
-                number_of_touches += 1
-                if number_of_touches > max_num_touches:
-                    break
-        if number_of_touches <= max_num_touches:
-            zones.append({"close_timestamp": base_candle["close_timestamp"],
-                        "high": base_candle["high"], "low": base_candle["low"]})
-
-    zones = pd.DataFrame(zones, columns=["close_timestamp", "high", "low"])
+    arr = _as_soa(data, ["open", "close", "high", "low", "open_timestamp", "close_timestamp"])
+    zone_close_ts, zone_high, zone_low = detect_zones(arr.open, arr.close, arr.high, arr.low,
+                                                      arr.open_timestamp, arr.close_timestamp,
+                                                      nocffz, max_num_touches)
+    zones = pd.DataFrame({"close_timestamp": zone_close_ts, "high": zone_high, "low": zone_low})
     zones = zones.sort_values(by="low", ascending=True, ignore_index=True)
     return zones
 
 
-def append_zones(zones: pd.DataFrame) -> pd.DataFrame:
-    """Appends overlapping zones
+def merge_zones(zones: pd.DataFrame) -> pd.DataFrame:
+    """Merges overlapping zones in a single sweep over zones sorted by their low price
 
     Args:
         zones: Pandas Dataframe object with columns: 
@@ -236,26 +452,24 @@ def append_zones(zones: pd.DataFrame) -> pd.DataFrame:
         Pandas Dataframe object with columns: 
             "close_timestamp", "high", "low"
     """
-    appended_zones = pd.DataFrame(columns=["close_timestamp", "high", "low"])
-    flag = 0
-    for index in range(1, len(zones)):
-        if flag == 1:
-            flag = 0
-            continue
-        if zones["high"][index - 1] >= zones["low"][index]:
-            new_zone = pd.DataFrame([[zones["close_timestamp"][index - 1], zones["high"]
-                                    [index], zones["low"][index - 1]]], columns=["close_timestamp", "high", "low"])
-            appended_zones = pd.concat([appended_zones, new_zone], axis=0)
-            flag = 1
+    if len(zones) == 0:
+        return zones.reset_index(drop=True)
+
+    zones = zones.sort_values(by="low", ascending=True, ignore_index=True)
+    arr = _as_soa(zones, ["close_timestamp", "high", "low"])
+
+    # plain Python scalars from tolist() are cheaper to compare than NumPy scalars
+    rows = zip(arr.close_timestamp.tolist(), arr.high.tolist(), arr.low.tolist())
+    merged = []
+    cur_ts, cur_high, cur_low = next(rows)
+    for close_ts, high, low in rows:
+        if low <= cur_high:
+            cur_high = max(cur_high, high)
         else:
-            new_zone = pd.DataFrame([[zones["close_timestamp"][index - 1], zones["high"][index - 1],
-                                    zones["low"][index - 1]]], columns=["close_timestamp", "high", "low"])
-            appended_zones = pd.concat([appended_zones, new_zone], axis=0)
-    last_zone = pd.DataFrame([[zones["close_timestamp"][index - 1], zones["high"][len(
-        zones) - 1], zones["low"][len(zones) - 1]]], columns=["close_timestamp", "high", "low"])
-    appended_zones = pd.concat([appended_zones, last_zone], axis=0)
-    appended_zones = appended_zones.reset_index(drop=True)
-    return appended_zones
+            merged.append((cur_ts, cur_high, cur_low))
+            cur_ts, cur_high, cur_low = close_ts, high, low
+    merged.append((cur_ts, cur_high, cur_low))
+    return pd.DataFrame(merged, columns=["close_timestamp", "high", "low"])
 
 
 def generate_chart(data: pd.DataFrame, zones: pd.DataFrame) -> None:
@@ -263,33 +477,37 @@ def generate_chart(data: pd.DataFrame, zones: pd.DataFrame) -> None:
     Uses matplotlib to open a chart that shows price and zones
 
     Args:
-        data: Pandas Dataframe object with columns: 
-            "open_timestamp", "open", "high", "low", "close", "volume",
-            "close_timestamp", "trades_number", "volume_per_trade", 
-            "candle_type", "momentum"
+        data: Pandas Dataframe object with at least the columns: 
+            "close_timestamp", "close"
+            (e.g. the output of build_dataset)
         zones: Pandas Dataframe object with columns: 
             "close_timestamp", "high", "low"
     """
-    while len(zones) > len(append_zones(zones)):
-        zones = append_zones(zones)
+    import matplotlib.dates as mdates
+    import matplotlib.pyplot as plt
+    from matplotlib.collections import PolyCollection
+
+    zones = merge_zones(zones)
 
 
     fig, ax = plt.subplots()
-    ax.plot(data["close_timestamp"], data["close"])
+    ax.plot(pd.to_datetime(data["close_timestamp"], unit="ms"), data["close"])
     ax.set_yscale("log")
-    for zone_row in zones.iterrows():
-        zone = zone_row[1]
-        bottom_left_point_x = zone["close_timestamp"]
-        bottom_left_point_y = zone["low"]
-        height = zone["high"] - zone["low"]
-        width = int(datetime.now().timestamp()*1000) - bottom_left_point_x
-        ax.add_patch(Rectangle((bottom_left_point_x, bottom_left_point_y), width,
-                    height, edgecolor="red", facecolor="red", fill=True, alpha=0.5))
+    # every zone is drawn as a rectangle from its base candle until now, all in a single collection
+    now_ms = int(datetime.now().timestamp()*1000)
+    left = mdates.date2num(pd.to_datetime(zones["close_timestamp"], unit="ms"))
+    right = np.full_like(left, mdates.date2num(pd.to_datetime(now_ms, unit="ms")))
+    bottom, top = zones[["low", "high"]].to_numpy(dtype=np.float64).T
+    verts = np.stack([np.column_stack([left, bottom]), np.column_stack([right, bottom]),
+                      np.column_stack([right, top]), np.column_stack([left, top])], axis=1)
+    ax.add_collection(PolyCollection(verts, edgecolors="red", facecolors="red", alpha=0.5))
+    ax.autoscale_view()
 
     plt.show()
 
 
-data = find_base_candles(generate_vol_per_trade(generate_missing_candles(get_candles("BTCUSDT", int(datetime(2018, 6, 1).timestamp()*1000), "4h"))), 6)
-zones = find_zones(data, 4)
-generate_chart(data, zones)
+if __name__ == "__main__":
+    data = build_dataset("BTCUSDT", int(datetime(2018, 6, 1).timestamp()*1000), "4h")
+    zones = find_zones_from_candles(data, 6, 4)
+    generate_chart(data, zones)
 